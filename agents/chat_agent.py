@@ -2,21 +2,457 @@
 Chat Agent - Main coordinator that processes user queries and determines appropriate actions
 """
 
-import json
+import hashlib
+import logging
 import os
-from typing import Dict, Any, List
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Generator, Iterator, List, Optional, Tuple
+import orjson
 from google import genai
+from google.genai import types
 from agents.weather_agent import WeatherAgent
+from utils.cache import SemanticCache, TTLCache
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 # Configure APIs
 TOMORROW_API_KEY = os.getenv("TOMORROW_API_KEY")
-print("Weather API key loaded in chat_agent:", bool(TOMORROW_API_KEY))
-if TOMORROW_API_KEY:
-    print("Weather API key length:", len(TOMORROW_API_KEY))
-else:
-    print("Available environment variables:", list(os.environ.keys()))
+if not TOMORROW_API_KEY:
+    logger.warning("TOMORROW_API_KEY is not set; weather lookups will fail")
+
+# Weather routing decisions keyed by normalized query. Only decisions whose city is
+# spelled out in the query are cached, since those do not depend on chat history.
+CLASSIFICATION_CACHE_TTL = 24 * 60 * 60  # seconds
+_classification_cache = TTLCache(maxsize=1024, ttl=CLASSIFICATION_CACHE_TTL)
+
+# Answers to general weather questions, shared by paraphrases of the same question
+# asked after the same earlier turns (answers may depend on them), e.g. as the
+# opening question of any session. It is consulted before routing, so the threshold
+# is strict enough that "weather in Paris" does not match "weather in Paris in winter".
+GENERAL_CACHE_THRESHOLD = 0.9
+GENERAL_CACHE_TTL = 6 * 60 * 60  # seconds
+_general_answer_cache = SemanticCache(threshold=GENERAL_CACHE_THRESHOLD, maxsize=1000, ttl=GENERAL_CACHE_TTL)
+
+# Number of recent messages included as conversation context
+CONTEXT_MESSAGES = 5
+COMPOSER_CONTEXT_MESSAGES = 3
+_ROLE_PREFIXES = {"user": "User: "}
+
+# Tomorrow.io fields the composer prompts use; everything else is dropped to save tokens.
+# Forecast fields are matched by prefix so daily Min/Max/Avg variants are kept.
+_CURRENT_FIELDS = ("temperature", "temperatureApparent", "humidity", "windSpeed", "windDirection",
+                   "weatherCode", "precipitationProbability", "visibility")
+_FORECAST_FIELDS = ("temperature", "humidity", "windSpeed", "weatherCode", "precipitationProbability")
+FORECAST_HOURLY_ENTRIES = 24
+# Tomorrow.io's daily forecast covers at most this many days
+MAX_FORECAST_DAYS = 10
+
+# Static instructions are sent as the system instruction so every request shares
+# a byte-identical prefix that Gemini's implicit prompt caching can reuse. Only the
+# per-request data (query, weather data, conversation) goes into the contents.
+ROUTER_SYSTEM = """You are a helpful weather assistant.
+If the user wants the current weather for a location, call get_current_weather.
+If the user wants a forecast or asks about upcoming weather for a location, call get_forecast.
+Use the conversation history to resolve follow-up questions, such as which location is meant.
+Otherwise answer the user's question directly based on your knowledge about weather.
+Keep your responses concise and informative. Use emojis where appropriate to make your responses visually appealing.
+"""
+
+CURRENT_WEATHER_SYSTEM = """You are a helpful weather assistant. The user asked about the current weather in one or more locations.
+You are given the raw weather data from the Tomorrow.io API (one entry per location), the recent conversation and the user's question.
+
+Please provide a friendly, natural language response that includes the most important information.
+Focus on these key aspects:
+1. Current temperature and how it feels
+2. Weather conditions (sunny, cloudy, rainy, etc.)
+3. Humidity and wind information
+4. Any notable weather phenomena
+
+Format your response in a clear, readable way. You can use formatting if appropriate.
+Keep your response concise but informative. Use emojis where appropriate to make it visually appealing.
+Do not include the raw JSON data in your response - translate it into natural language.
+"""
+
+FORECAST_SYSTEM = """You are a helpful weather assistant. The user asked for a weather forecast for one or more locations.
+You are given the raw forecast data from the Tomorrow.io API (one entry per location), the recent conversation and the user's question.
+
+Please provide a friendly, natural language response that includes the most important information.
+Organize the forecast in a clear, readable format, day by day.
+For each day/time period, include:
+1. Date and time
+2. Temperature (and feels like temperature if available)
+3. Weather conditions
+4. Precipitation probability
+5. Wind information
+6. Notable weather phenomena
+
+You can use formatting, lists, or any other format that best presents the data.
+Use emojis to make the forecast visually appealing.
+Keep your response concise but informative.
+Do not include the raw JSON data in your response - translate it into natural language.
+"""
+
+GENERAL_SYSTEM = """You are a helpful weather assistant. Answer the user's question based on your knowledge about weather.
+Keep your responses concise and informative. Use emojis where appropriate to make your responses visually appealing.
+"""
+
+# Templates for the dynamic tail of each request
+CURRENT_WEATHER_TEMPLATE = """Location: {location}
+
+Weather data from the Tomorrow.io API:
+{weather_json}
+
+Recent conversation context:
+{context}
+
+User's question: {user_query}
+"""
+
+FORECAST_TEMPLATE = """Location: {location}
+
+Forecast data from the Tomorrow.io API:
+{forecast_json}
+
+Recent conversation context:
+{context}
+
+User's question: {user_query}
+"""
+
+GENERAL_TEMPLATE = """Conversation history:
+{context}
+
+User's latest question: {user_query}
+"""
+
+# Weather lookups Gemini can request instead of answering directly
+WEATHER_TOOL = types.Tool(function_declarations=[
+    types.FunctionDeclaration(
+        name="get_current_weather",
+        description="Get the current weather conditions for a city.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "city": types.Schema(type=types.Type.STRING, description="City name, e.g. London or New York"),
+            },
+            required=["city"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_forecast",
+        description="Get the weather forecast for a city for the coming days.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "city": types.Schema(type=types.Type.STRING, description="City name, e.g. London or New York"),
+                "days": types.Schema(type=types.Type.INTEGER, description="Number of days to forecast"),
+            },
+            required=["city"],
+        ),
+    ),
+])
+_TOOL_ACTIONS = {"get_current_weather": "current_weather", "get_forecast": "forecast"}
+
+# Appended when a Gemini reply breaks off after part of it was already shown
+INTERRUPTED_NOTE = "\n\n_(The response was interrupted. Please try asking again.)_"
+
+_ROUTER_CONFIG = types.GenerateContentConfig(system_instruction=ROUTER_SYSTEM, tools=[WEATHER_TOOL])
+_CURRENT_WEATHER_CONFIG = types.GenerateContentConfig(system_instruction=CURRENT_WEATHER_SYSTEM)
+_FORECAST_CONFIG = types.GenerateContentConfig(system_instruction=FORECAST_SYSTEM)
+_GENERAL_CONFIG = types.GenerateContentConfig(system_instruction=GENERAL_SYSTEM)
+
+_MONTHS = (r"january|february|march|april|may|june|july|august|september|october|november|december"
+           r"|jan|feb|apr|jun|jul|aug|sept|oct|nov|dec")
+# Capitalized words after in/for/at that are not places ("in January", "in Summer",
+# "in Fahrenheit", "for Tomorrow", "at Noon"), so they never count as a city guess
+_NOT_PLACE = (
+    rf"(?i:(?:{_MONTHS}"
+    r"|spring|summer|autumn|fall|winter"
+    r"|(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)s?|weekends?"
+    r"|celsius|fahrenheit|kelvin|centigrade|metric|imperial|c|f|k"
+    r"|today|tomorrow|tonight|now|noon|midday|midnight|dawn|dusk|morning|afternoon|evening|night"
+    r"|week|month|year"
+    r"|the|a|an)\b)"
+)
+# One word of a place name: an initialism ("D.C."), an abbreviation followed by the rest
+# of the name ("St. Louis", "Ft. Worth") or a plain capitalized word. Other periods end
+# the name, so "in Paris. What about..." stops at "Paris".
+_PLACE_WORD = r"(?:[A-Z](?:\.[A-Z])+\.?|[A-Z][a-z]{0,2}\.(?=\s+[A-Z])|[A-Z][\w'-]*)"
+_PLACE_NAME = rf"(?!{_NOT_PLACE}){_PLACE_WORD}(?:\s+(?!{_NOT_PLACE}){_PLACE_WORD})*"
+# Cheap guess at the location(s) in a query ("... in Paris", "... for New York",
+# "... in Springfield, IL", "... in London and Paris"), used to start fetching weather
+# data while the classifier is still running. _split_places() separates the places.
+_CITY_GUESS_RE = re.compile(
+    rf"\b(?:in|for|at)\s+({_PLACE_NAME}(?:(?:\s*,\s*(?:and\s+)?|\s+and\s+|\s*&\s*){_PLACE_NAME})*)"
+)
+_AND_SEPARATOR_RE = re.compile(r"\s*,?\s+and\s+|\s*&\s*")
+# Abbreviated regions that qualify the city before them ("IL", "UK", "D.C.")
+_REGION_ABBR_RE = re.compile(r"[A-Z]{2,3}|(?:[A-Z]\.){2,3}")
+# Lower-confidence guess for uncapitalized names ("weather in paris"): at most two words,
+# stopping before common time words
+_LOOSE_CITY_GUESS_RE = re.compile(
+    rf"\b(?:in|for|at)\s+((?!{_NOT_PLACE})[a-z][\w'-]*"
+    r"(?:\s+(?!(?:today|tomorrow|tonight|now|this|next|right|please|and|or|in|at|for|on)\b)[a-z][\w'-]*)?)",
+    re.IGNORECASE
+)
+_FORECAST_HINT_RE = re.compile(r"\b(?:forecast|tomorrow|week|days?)\b", re.IGNORECASE)
+# Queries that are clearly weather lookups and can skip the Gemini routing call
+_WEATHER_WORD_RE = re.compile(r"\b(?:weather|temperature|forecast|rain|raining|snow|snowing|windy|humid|humidity)\b",
+                              re.IGNORECASE)
+_DAYS_RE = re.compile(r"\b(\d{1,2})[\s-]*days?\b", re.IGNORECASE)
+# Questions about climate or causes rather than the conditions right now
+# ("average temperature in Paris in December", "what causes rain in India"), which
+# are left to Gemini even when they name a place
+_CLIMATE_CUE_RE = re.compile(
+    rf"\b(?:average|usual(?:ly)?|typical(?:ly)?|normal(?:ly)?|climate|causes?|why)\b|\bin\s+(?:{_MONTHS})\b",
+    re.IGNORECASE
+)
+# What may follow the place in a query the fast path answers: time phrases it
+# understands and punctuation. Anything else ("... during the Monsoon") may change
+# the meaning, so the query goes to Gemini.
+_FAST_PATH_TAIL_RE = re.compile(
+    r"(?:\s*,|\s+(?:please|like|(?:right\s+)?now|today|tonight|tomorrow|(?:this|next)\s+week(?:end)?"
+    r"|(?:(?:for|over|in)\s+)?(?:the\s+)?(?:next\s+)?\d{1,2}[\s-]*days?))*\s*[?.!]*\s*",
+    re.IGNORECASE
+)
+
+
+def _query_key(user_query: str) -> str:
+    """Return a stable cache key for a user query."""
+    return hashlib.sha256(user_query.strip().lower().encode()).hexdigest()
+
+
+def _format_history(chat_history: List[Dict[str, str]]) -> List[str]:
+    """Format the most recent messages as "User: ..." / "Assistant: ..." lines."""
+    return [_ROLE_PREFIXES.get(msg['role'], "Assistant: ") + msg['content']
+            for msg in chat_history[-CONTEXT_MESSAGES:]]
+
+
+def _context_key(user_query: str, chat_history: List[Dict[str, str]]) -> str:
+    """Return a stable cache namespace for the conversation the query follows.
+    
+    chat_history may already end with the query itself, which is left out so that
+    paraphrases of the query share the namespace.
+    """
+    if chat_history and chat_history[-1]['role'] == "user" and chat_history[-1]['content'] == user_query:
+        chat_history = chat_history[:-1]
+    return hashlib.sha256("\n".join(_format_history(chat_history)).encode()).hexdigest()
+
+
+def _split_places(text: str) -> List[str]:
+    """Split a matched place list into places, keeping ", Region" qualifiers.
+    
+    "and"/"&" always separate places, and so do commas, except before the region
+    qualifier of a city that has none yet. A qualifier is an abbreviation
+    ("Springfield, IL") or, in a list made only of "City, Region" pairs, the second
+    item of each pair: "Paris, France and Berlin, Germany" is two places, while
+    "London, Paris and Tokyo" is three. A lone "London, Paris" is kept whole, as it
+    cannot be told apart from "Paris, France"; see _is_ambiguous_pair().
+    """
+    groups = [[item.strip() for item in group.split(",")] for group in _AND_SEPARATOR_RE.split(text)]
+    paired = all(len(items) == 2 for items in groups)
+    places = []
+    for items in groups:
+        qualified = True  # the first item of a group always starts a new place
+        for item in items:
+            if not qualified and (paired or _REGION_ABBR_RE.fullmatch(item)):
+                places[-1] += ", " + item
+                qualified = True
+            else:
+                places.append(item)
+                qualified = False
+    return places
+
+
+def _is_ambiguous_pair(text: str) -> bool:
+    """Return whether a matched place list is a lone "A, B" that may be one place or two."""
+    items = [item.strip() for item in text.split(",")]
+    return (len(items) == 2 and not _AND_SEPARATOR_RE.search(text)
+            and not _REGION_ABBR_RE.fullmatch(items[1]))
+
+
+def _guess_city(user_query: str) -> Tuple[Optional[str], bool]:
+    """Return the place name following in/for/at in the query and whether it is confident.
+    
+    A capitalized name is a confident guess. An uncapitalized one is only returned for
+    queries that mention the weather, and is used to speculate, never to skip Gemini.
+    """
+    match = _CITY_GUESS_RE.search(user_query)
+    if match:
+        return _split_places(match.group(1))[0], True
+    if _WEATHER_WORD_RE.search(user_query):
+        match = _LOOSE_CITY_GUESS_RE.search(user_query)
+        if match:
+            return match.group(1), False
+    return None, False
+
+
+def names_place(user_query: str) -> bool:
+    """Return whether the query spells out a capitalized place name after in/for/at."""
+    return _CITY_GUESS_RE.search(user_query) is not None
+
+
+def _guess_cities(user_query: str) -> List[str]:
+    """Return the capitalized place names listed after in/for/at, if there are several."""
+    match = _CITY_GUESS_RE.search(user_query)
+    places = _split_places(match.group(1)) if match else []
+    return places if len(places) > 1 else []
+
+
+def _location_name(weather_data: Dict[str, Any]) -> Optional[str]:
+    """Return the resolved location name from a Tomorrow.io response, if present."""
+    location_info = weather_data.get('location')
+    return location_info.get('name') if isinstance(location_info, dict) else None
+
+
+def _slim_current_weather(weather_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only the realtime fields the composer prompt needs."""
+    data = weather_data.get('data')
+    data = data if isinstance(data, dict) else {}
+    values = data.get('values') or {}
+    return {
+        "location": _location_name(weather_data),
+        "time": data.get('time'),
+        "values": {k: values[k] for k in _CURRENT_FIELDS if k in values}
+    }
+
+
+def _slim_forecast(forecast_data: Dict[str, Any], days: int) -> Dict[str, Any]:
+    """Keep the requested days of daily entries, the next hours and only the useful fields."""
+    timelines = forecast_data.get('timelines')
+    timelines = timelines if isinstance(timelines, dict) else {}
+    slim_timelines = {}
+    for name, limit in (("daily", days), ("hourly", FORECAST_HOURLY_ENTRIES)):
+        entries = timelines.get(name)
+        if isinstance(entries, list):
+            slim_timelines[name] = [
+                {
+                    "time": entry.get('time'),
+                    "values": {k: v for k, v in (entry.get('values') or {}).items() if k.startswith(_FORECAST_FIELDS)}
+                }
+                for entry in entries[:limit] if isinstance(entry, dict)
+            ]
+    return {"location": _location_name(forecast_data), "timelines": slim_timelines}
+
+
+def _format_current_weather_fallback(weather_data: Dict[str, Any], location: str) -> str:
+    """Summarize a Tomorrow.io realtime response as plain text, for when Gemini is unavailable."""
+    # Extract key information from Tomorrow.io response
+    data = weather_data.get('data', {})
+    values = data.get('values', {}) if isinstance(data, dict) else {}
+    location_info = weather_data.get('location', {}) if isinstance(weather_data, dict) else {}
+    
+    # Extract values
+    temp = values.get('temperature')
+    apparent_temp = values.get('temperatureApparent')
+    humidity = values.get('humidity')
+    wind_speed = values.get('windSpeed')
+    wind_direction = values.get('windDirection')
+    visibility = values.get('visibility')
+    
+    # Get location name
+    loc_name = location_info.get('name', location) if isinstance(location_info, dict) else location
+    
+    # Create a simple text response
+    parts = [f"🌤️ Current weather in {loc_name}:\n\n"]
+    if temp is not None:
+        feels_like = f" (Feels like {apparent_temp}°C)" if apparent_temp is not None else ""
+        parts.append(f"🌡️ Temperature: {temp}°C{feels_like}\n")
+    if humidity is not None:
+        parts.append(f"💧 Humidity: {humidity}%\n")
+    if wind_speed is not None:
+        direction = f" from {wind_direction}°" if wind_direction is not None else ""
+        parts.append(f"💨 Wind: {wind_speed} m/s{direction}\n")
+    if visibility is not None:
+        parts.append(f"👁️ Visibility: {visibility} km\n")
+    return "".join(parts)
+
+
+def _format_forecast_fallback(forecast_data: Dict[str, Any], location: str) -> str:
+    """Summarize a Tomorrow.io forecast response as plain text, for when Gemini is unavailable."""
+    timelines = forecast_data.get('timelines', {})
+    location_info = forecast_data.get('location', {})
+    
+    # Get location name
+    loc_name = location_info.get('name', location) if isinstance(location_info, dict) else location
+    
+    # Use the finest timeline available: minutely, then hourly, then daily
+    forecast_entries = []
+    if isinstance(timelines, dict):
+        for name in ("minutely", "hourly", "daily"):
+            if isinstance(timelines.get(name), list):
+                forecast_entries = timelines[name]
+                break
+    if not forecast_entries:
+        return "Unable to extract forecast information."
+    
+    parts = [f"🌤️ Weather forecast for {loc_name}:\n\n"]
+    for entry in forecast_entries[:10]:
+        if not isinstance(entry, dict):
+            continue
+        values = entry.get('values') or {}
+        temp = values.get('temperature')
+        apparent_temp = values.get('temperatureApparent')
+        humidity = values.get('humidity')
+        wind_speed = values.get('windSpeed')
+        precipitation_prob = values.get('precipitationProbability')
+        
+        parts.append(f"⏰ {entry.get('time', 'N/A')}:\n")
+        if temp is not None:
+            feels_like = f" (Feels like {apparent_temp}°C)" if apparent_temp is not None else ""
+            parts.append(f"   🌡️ {temp}°C{feels_like}\n")
+        if humidity is not None:
+            parts.append(f"   💧 Humidity: {humidity}%\n")
+        if precipitation_prob is not None:
+            parts.append(f"   🌧️ Precipitation: {precipitation_prob}%\n")
+        if wind_speed is not None:
+            parts.append(f"   💨 Wind: {wind_speed} m/s\n")
+        parts.append("\n")
+    return "".join(parts)
+
+
+def _fast_classify(user_query: str) -> Optional[Dict[str, Any]]:
+    """Classify common "weather in <City>" style queries without calling Gemini.
+    
+    Returns the same action dict as ChatAgent.process_query, or None if the query
+    does not clearly ask for a weather lookup.
+    """
+    if not _WEATHER_WORD_RE.search(user_query) or _CLIMATE_CUE_RE.search(user_query):
+        return None
+    match = _CITY_GUESS_RE.search(user_query)
+    if not match or not _FAST_PATH_TAIL_RE.fullmatch(user_query, match.end()):
+        return None
+    # Gemini tells "London, Paris" (two cities) from "Paris, France" (one)
+    if _is_ambiguous_pair(match.group(1)):
+        return None
+    places = _split_places(match.group(1))
+    parameters = {"city": places[0]}
+    if len(places) > 1:
+        parameters["cities"] = places
+    if _FORECAST_HINT_RE.search(user_query):
+        days_match = _DAYS_RE.search(user_query)
+        parameters["days"] = int(days_match.group(1)) if days_match else 5
+        return {"action": "forecast", "parameters": parameters}
+    return {"action": "current_weather", "parameters": parameters}
+
+
+class ResponseStream:
+    """Iterable over the text chunks of a reply.
+    
+    complete is True once the reply has been fully generated as a regular answer, as
+    opposed to an error, a fallback summary or a request for more details, i.e. when
+    it is safe to cache.
+    """
+    
+    def __init__(self, chunks: Generator[str, None, Optional[bool]]):
+        self._chunks = chunks
+        self.complete = False
+    
+    def __iter__(self) -> Iterator[str]:
+        self.complete = bool((yield from self._chunks))
 
 
 class ChatAgent:
@@ -25,319 +461,303 @@ class ChatAgent:
     def __init__(self, client: genai.Client):
         self.model = client
         self.weather_agent = WeatherAgent(TOMORROW_API_KEY)
+        # Runs weather API calls concurrently with the Gemini calls
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat-agent")
+        self._lookups = {
+            "current_weather": self.weather_agent.get_current_weather,
+            "forecast": self.weather_agent.get_forecast,
+        }
     
-    def process_query(self, user_query: str, chat_history: List[Dict[str, str]]) -> Dict[str, Any]:
-        """Process user query and determine appropriate action."""
-        # Use Gemini to understand the query and decide what to do
-        prompt = f"""
-        You are a weather assistant. Based on the user's query, determine what action to take.
-        Possible actions are:
-        1. "current_weather" - for current weather information
-        2. "forecast" - for weather forecast
-        3. "general" - for general weather questions
-        
-        Also extract any relevant parameters like city name from the query.
+    def _prefetch_weather(self, user_query: str) -> Optional[Tuple[str, Dict[str, Future]]]:
+        """Start fetching weather for the cities guessed from the query, before classification.
         
-        User query: "{user_query}"
-        
-        Respond ONLY in JSON format with action and parameters:
-        {{
-            "action": "action_type",
-            "parameters": {{
-                "city": "city_name_if_applicable",
-                "days": number_of_days_if_applicable
-            }}
-        }}
+        Returns the guessed action and the in-flight lookups keyed by normalized city.
+        """
+        cities = _guess_cities(user_query)
+        if not cities:
+            city, _ = _guess_city(user_query)
+            if not city:
+                return None
+            cities = [city]
+        action = "forecast" if _FORECAST_HINT_RE.search(user_query) else "current_weather"
+        fetch = self._lookups[action]
+        return action, {city.lower(): self._executor.submit(fetch, city) for city in cities}
+    
+    @staticmethod
+    def _claim_prefetch(prefetch: Optional[Tuple[str, Dict[str, Future]]], action: str,
+                        location: str) -> Optional[Future]:
+        """Return the prefetched lookup for location if it matches the classified request."""
+        if prefetch is None or prefetch[0] != action:
+            return None
+        return prefetch[1].pop(location.strip().lower(), None)
+    
+    @staticmethod
+    def _discard_prefetch(prefetch: Optional[Tuple[str, Dict[str, Future]]]) -> None:
+        """Cancel the prefetched lookups the classified request did not claim."""
+        if prefetch is not None:
+            for future in prefetch[1].values():
+                future.cancel()
+    
+    def _fetch_weather(self, action: str, locations: List[str],
+                       prefetch: Optional[Tuple[str, Dict[str, Future]]]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Run the action's lookup for each location concurrently, reusing prefetched lookups."""
+        futures = []
+        for location in locations:
+            future = self._claim_prefetch(prefetch, action, location)
+            if future is None:
+                logger.debug("Fetching %s for: %s", action, location)
+                future = self._executor.submit(self._lookups[action], location)
+            futures.append(future)
+        self._discard_prefetch(prefetch)
+        return [(location, future.result()) for location, future in zip(locations, futures)]
+    
+    def process_query(self, user_query: str, chat_history: List[Dict[str, str]],
+                      history_lines: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Process user query and determine appropriate action.
         
-        IMPORTANT: Respond ONLY with the JSON, no other text.
+        Gemini either requests one of the weather tools, which becomes the action and
+        parameters, or answers the question directly, which is returned as a "general"
+        action carrying the answer so no second round trip is needed.
+        history_lines can pass in the already formatted chat history.
         """
+        query_key = _query_key(user_query)
+        cached = _classification_cache.get(query_key)
+        if cached is not None:
+            return cached
         
+        if history_lines is None:
+            history_lines = _format_history(chat_history)
+        context = "\n".join(history_lines)
+        
+        # Use Gemini to understand the query and decide what to do
         try:
             response = self.model.models.generate_content(
                 model="gemini-2.5-flash",
-                contents=prompt
+                contents=GENERAL_TEMPLATE.format(context=context, user_query=user_query),
+                config=_ROUTER_CONFIG
             )
-            # Access the text content properly
-            if hasattr(response, 'text'):
-                clean_response = response.text
-            else:
-                # Handle different response format
-                clean_response = str(response)
-            # Clean up the response text
-            clean_response = response.text.strip()
-            # Remove any markdown code block indicators
-            if clean_response.startswith("```"):
-                clean_response = clean_response[3:].strip()
-                if clean_response.startswith("json"):
-                    clean_response = clean_response[4:].strip()
-            if clean_response.endswith("```"):
-                clean_response = clean_response[:-3].strip()
-            
-            # Find the first { and last } to extract JSON
-            start_idx = clean_response.find('{')
-            end_idx = clean_response.rfind('}')
-            if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                clean_response = clean_response[start_idx:end_idx+1]
+            function_calls = [call for call in response.function_calls or [] if call.name in _TOOL_ACTIONS]
+            if function_calls:
+                call = function_calls[0]
+                action_data = {
+                    "action": _TOOL_ACTIONS[call.name],
+                    "parameters": dict(call.args or {})
+                }
+                # Gemini issues one call per city for multi-city questions
+                cities = [c.args["city"] for c in function_calls
+                          if c.name == call.name and c.args and c.args.get("city")]
+                if len(cities) > 1:
+                    action_data["parameters"]["cities"] = cities
+                else:
+                    cities = [action_data["parameters"].get("city")]
+                if all(city and city.lower() in user_query.lower() for city in cities):
+                    _classification_cache.set(query_key, action_data)
+                return action_data
             
-            # Parse the JSON response
-            action_data = json.loads(clean_response)
-            return action_data
-        except json.JSONDecodeError as e:
-            # If JSON parsing fails, fallback to general response
-            print("Could not parse action from AI response. Using general action.")
+            # response.text is None when Gemini returned no text parts
             return {
                 "action": "general",
-                "parameters": {}
+                "parameters": {},
+                "answer": (response.text or "").strip()
             }
         except Exception as e:
-            # Handle other exceptions
-            print("Error processing query. Using general action.")
+            # Fall back to a plain general response. The query may well have been a
+            # weather lookup, so the answer must not be cached as a general one.
+            logger.warning("Error processing query, using general action: %s", e)
             return {
                 "action": "general",
-                "parameters": {}
+                "parameters": {},
+                "routing_failed": True
             }
     
-    def get_response(self, user_query: str, chat_history: List[Dict[str, str]]) -> Any:
+    def _stream_text(self, prompt: str, config: types.GenerateContentConfig) -> Iterator[str]:
+        """Yield the text of a Gemini response as it is generated."""
+        for chunk in self.model.models.generate_content_stream(
+            model="gemini-2.5-flash",
+            contents=prompt,
+            config=config
+        ):
+            if chunk.text:
+                yield chunk.text
+    
+    def _stream_reply(self, prompt: str, config: types.GenerateContentConfig,
+                      parts: Optional[List[str]] = None) -> Generator[str, None, bool]:
+        """Yield a Gemini-composed reply, returning True if it streamed to the end.
+        
+        A failure before any text was sent is raised so the caller can fall back to a
+        different reply. After partial text the reply is ended with a note instead, as
+        anything appended would be spliced onto the half-finished answer.
+        Streamed text is also appended to parts, if given.
+        """
+        sent = False
+        try:
+            for text in self._stream_text(prompt, config):
+                sent = True
+                if parts is not None:
+                    parts.append(text)
+                yield text
+        except Exception as e:
+            if not sent:
+                raise
+            logger.warning("Gemini AI stream interrupted: %s", e)
+            yield INTERRUPTED_NOTE
+            return False
+        return True
+    
+    def get_response(self, user_query: str, chat_history: List[Dict[str, str]]) -> str:
         """Get appropriate response based on query analysis."""
-        # Process the query to determine action
-        action_data = self.process_query(user_query, chat_history)
+        return "".join(self.get_response_stream(user_query, chat_history))
+    
+    def get_response_stream(self, user_query: str, chat_history: List[Dict[str, str]]) -> ResponseStream:
+        """Return the response to the query as a stream of text chunks.
+        
+        Gemini-composed answers are streamed chunk by chunk; direct and cached answers,
+        errors and fallback text are yielded in one piece. The stream's complete flag
+        tells whether the reply was a regular answer.
+        """
+        return ResponseStream(self._generate_response(user_query, chat_history))
+    
+    def _generate_response(self, user_query: str,
+                           chat_history: List[Dict[str, str]]) -> Generator[str, None, Optional[bool]]:
+        """Yield the response chunks, returning True if the reply is a regular answer."""
+        history_lines = _format_history(chat_history)
+        
+        # Common weather lookups are recognized locally without a Gemini call
+        action_data = _fast_classify(user_query)
+        prefetch = None
+        context_key = _context_key(user_query, chat_history)
+        if action_data is None:
+            # Anything else may be a near-duplicate of a general question answered before
+            cached_answer = _general_answer_cache.get(user_query, namespace=context_key)
+            if cached_answer is not None:
+                yield cached_answer
+                return True
+            
+            # Speculatively fetch weather for every named city while the classifier decides
+            # what to do, so the lookups overlap the Gemini call instead of following it
+            prefetch = self._prefetch_weather(user_query)
+            
+            # Process the query to determine action (answers general questions directly)
+            action_data = self.process_query(user_query, chat_history, history_lines)
         action = action_data.get("action", "general")
         parameters = action_data.get("parameters", {})
         
         if action == "current_weather":
-            location = parameters.get("location") or parameters.get("city")
-            if location:
-                print(f"Fetching current weather for: {location}")
-                weather_data = self.weather_agent.get_current_weather(location)
-                print(f"Weather data received: {type(weather_data)}")
-                if "error" in weather_data:
-                    print(f"Weather API error: {weather_data['error']}")
-                    return f"Sorry, I couldn't get the weather information for {location}. Error: {weather_data['error']}"
+            locations = parameters.get("cities") or [parameters.get("location") or parameters.get("city")]
+            locations = [location for location in locations if location]
+            if locations:
+                found = []
+                errors = []
+                for location, weather_data in self._fetch_weather(action, locations, prefetch):
+                    logger.debug("Weather data received: %s", type(weather_data))
+                    if "error" in weather_data:
+                        logger.info("Weather API error: %s", weather_data['error'])
+                        errors.append(f"Sorry, I couldn't get the weather information for {location}. Error: {weather_data['error']}")
+                    else:
+                        found.append((location, weather_data))
+                if not found:
+                    yield "\n\n".join(errors)
+                    return
                 
                 # Send raw weather data to LLM for natural language composition
-                context = "\n".join([f"User: {msg['content']}" if msg['role'] == 'user' else f"Assistant: {msg['content']}" 
-                                    for msg in chat_history[-3:]])  # Last 3 messages for context
-                
-                prompt = f"""
-                You are a helpful weather assistant. The user asked about the current weather in {location}.
-                Here is the raw weather data from the Tomorrow.io API:
-                
-                {json.dumps(weather_data, indent=2)}
-                
-                Please provide a friendly, natural language response that includes the most important information.
-                Focus on these key aspects:
-                1. Current temperature and how it feels
-                2. Weather conditions (sunny, cloudy, rainy, etc.)
-                3. Humidity and wind information
-                4. Any notable weather phenomena
-                
-                Format your response in a clear, readable way. You can use formatting if appropriate.
-                Keep your response concise but informative. Use emojis where appropriate to make it visually appealing.
-                Do not include the raw JSON data in your response - translate it into natural language.
+                context = "\n".join(history_lines[-COMPOSER_CONTEXT_MESSAGES:])
                 
-                Recent conversation context:
-                {context}
-                
-                User's question: {user_query}
-                """
+                prompt = CURRENT_WEATHER_TEMPLATE.format(
+                    location=", ".join(location for location, _ in found),
+                    weather_json=orjson.dumps([_slim_current_weather(data) for _, data in found]).decode(),
+                    context=context,
+                    user_query=user_query
+                )
                 
+                complete = False
                 try:
-                    print("Sending request to Gemini AI...")
-                    response = self.model.models.generate_content(
-                        model="gemini-2.5-flash",
-                        contents=prompt
-                    )
-                    print("Received response from Gemini AI")
-                    # Access the text content properly
-                    if hasattr(response, 'text'):
-                        return response.text
-                    else:
-                        # Handle different response format
-                        return str(response)
+                    logger.debug("Sending request to Gemini AI")
+                    complete = yield from self._stream_reply(prompt, _CURRENT_WEATHER_CONFIG)
+                    logger.debug("Received response from Gemini AI")
                 except Exception as e:
-                    print(f"Gemini AI error: {str(e)}")
+                    logger.warning("Gemini AI error: %s", e)
                     # Fallback to extracting key information if LLM fails
                     try:
-                        # Extract key information from Tomorrow.io response
-                        data = weather_data.get('data', {})
-                        values = data.get('values', {}) if isinstance(data, dict) else {}
-                        location_info = weather_data.get('location', {}) if isinstance(weather_data, dict) else {}
-                        
-                        # Extract values
-                        temp = values.get('temperature')
-                        apparent_temp = values.get('temperatureApparent')
-                        humidity = values.get('humidity')
-                        wind_speed = values.get('windSpeed')
-                        wind_direction = values.get('windDirection')
-                        weather_code = values.get('weatherCode')
-                        visibility = values.get('visibility')
-                        
-                        # Get location name
-                        loc_name = location_info.get('name', location) if isinstance(location_info, dict) else location
-                        
-                        # Create a simple text response
-                        response_text = f"🌤️ Current weather in {loc_name}:\n\n"
-                        if temp is not None:
-                            response_text += f"🌡️ Temperature: {temp}°C"
-                            if apparent_temp is not None:
-                                response_text += f" (Feels like {apparent_temp}°C)\n"
-                            else:
-                                response_text += "\n"
-                        if humidity is not None:
-                            response_text += f"💧 Humidity: {humidity}%\n"
-                        if wind_speed is not None:
-                            direction = f" from {wind_direction}°" if wind_direction is not None else ""
-                            response_text += f"💨 Wind: {wind_speed} m/s{direction}\n"
-                        if visibility is not None:
-                            response_text += f"👁️ Visibility: {visibility} km\n"
-                        
-                        return response_text or "Unable to extract weather information."
+                        yield "\n".join(_format_current_weather_fallback(data, location) for location, data in found)
                     except (KeyError, IndexError, TypeError) as e:
-                        return f"Sorry, I couldn't parse the weather data. Error: {str(e)}"
+                        yield f"Sorry, I couldn't parse the weather data. Error: {str(e)}"
+                if errors:
+                    yield "\n\n" + "\n\n".join(errors)
+                return complete and not errors
             else:
-                return "Please specify a location to get the current weather."
+                self._discard_prefetch(prefetch)
+                yield "Please specify a location to get the current weather."
         
         elif action == "forecast":
-            location = parameters.get("location") or parameters.get("city")
-            days = parameters.get("days", 5)
-            if location:
-                print(f"Fetching forecast for: {location}")
-                forecast_data = self.weather_agent.get_forecast(location)
-                print(f"Forecast data received: {type(forecast_data)}")
-                if "error" in forecast_data:
-                    print(f"Forecast API error: {forecast_data['error']}")
-                    return f"Sorry, I couldn't get the forecast for {location}. Error: {forecast_data['error']}"
+            locations = parameters.get("cities") or [parameters.get("location") or parameters.get("city")]
+            locations = [location for location in locations if location]
+            try:
+                days = int(parameters.get("days") or 5)
+            except (TypeError, ValueError):
+                days = 5
+            days = max(1, min(days, MAX_FORECAST_DAYS))
+            if locations:
+                found = []
+                errors = []
+                for location, forecast_data in self._fetch_weather(action, locations, prefetch):
+                    logger.debug("Forecast data received: %s", type(forecast_data))
+                    if "error" in forecast_data:
+                        logger.info("Forecast API error: %s", forecast_data['error'])
+                        errors.append(f"Sorry, I couldn't get the forecast for {location}. Error: {forecast_data['error']}")
+                    else:
+                        found.append((location, forecast_data))
+                if not found:
+                    yield "\n\n".join(errors)
+                    return
                 
                 # Send raw forecast data to LLM for natural language composition
-                context = "\n".join([f"User: {msg['content']}" if msg['role'] == 'user' else f"Assistant: {msg['content']}" 
-                                    for msg in chat_history[-3:]])  # Last 3 messages for context
-                
-                prompt = f"""
-                You are a helpful weather assistant. The user asked for a weather forecast for {location}.
-                Here is the raw forecast data from the Tomorrow.io API:
-                
-                {json.dumps(forecast_data, indent=2)}
-                
-                Please provide a friendly, natural language response that includes the most important information.
-                Organize the forecast in a clear, readable format, day by day.
-                For each day/time period, include:
-                1. Date and time
-                2. Temperature (and feels like temperature if available)
-                3. Weather conditions
-                4. Precipitation probability
-                5. Wind information
-                6. Notable weather phenomena
+                context = "\n".join(history_lines[-COMPOSER_CONTEXT_MESSAGES:])
                 
-                You can use formatting, lists, or any other format that best presents the data.
-                Use emojis to make the forecast visually appealing.
-                Keep your response concise but informative.
-                Do not include the raw JSON data in your response - translate it into natural language.
-                
-                Recent conversation context:
-                {context}
-                
-                User's question: {user_query}
-                """
+                prompt = FORECAST_TEMPLATE.format(
+                    location=", ".join(location for location, _ in found),
+                    forecast_json=orjson.dumps([_slim_forecast(data, days) for _, data in found]).decode(),
+                    context=context,
+                    user_query=user_query
+                )
                 
+                complete = False
                 try:
-                    print("Sending forecast request to Gemini AI...")
-                    response = self.model.models.generate_content(
-                        model="gemini-2.5-flash",
-                        contents=prompt
-                    )
-                    print("Received forecast response from Gemini AI")
-                    # Access the text content properly
-                    if hasattr(response, 'text'):
-                        return response.text
-                    else:
-                        # Handle different response format
-                        return str(response)
+                    logger.debug("Sending forecast request to Gemini AI")
+                    complete = yield from self._stream_reply(prompt, _FORECAST_CONFIG)
+                    logger.debug("Received forecast response from Gemini AI")
                 except Exception as e:
-                    print(f"Gemini AI forecast error: {str(e)}")
+                    logger.warning("Gemini AI forecast error: %s", e)
                     # Fallback to extracting key information if LLM fails
                     try:
-                        # Extract key information from Tomorrow.io forecast response
-                        timelines = forecast_data.get('timelines', {})
-                        location_info = forecast_data.get('location', {}) if isinstance(forecast_data, dict) else {}
-                        
-                        # Get location name
-                        loc_name = location_info.get('name', location) if isinstance(location_info, dict) else location
-                        
-                        # Process timeline data - handle different timeline types
-                        if timelines and isinstance(timelines, dict):
-                            # Try to get minutely data first, then hourly, then daily
-                            forecast_entries = []
-                            if 'minutely' in timelines and isinstance(timelines['minutely'], list):
-                                forecast_entries = timelines['minutely']
-                            elif 'hourly' in timelines and isinstance(timelines['hourly'], list):
-                                forecast_entries = timelines['hourly']
-                            elif 'daily' in timelines and isinstance(timelines['daily'], list):
-                                forecast_entries = timelines['daily']
-                            
-                            if forecast_entries:
-                                response_text = f"🌤️ Weather forecast for {loc_name}:\n\n"
-                                
-                                # Show first few entries
-                                for i, entry in enumerate(forecast_entries[:10]):  # Show first 10 entries
-                                    if isinstance(entry, dict):
-                                        time = entry.get('time', 'N/A')
-                                        values = entry.get('values', {}) if isinstance(entry, dict) else {}
-                                        
-                                        # Extract values
-                                        temp = values.get('temperature')
-                                        apparent_temp = values.get('temperatureApparent')
-                                        humidity = values.get('humidity')
-                                        wind_speed = values.get('windSpeed')
-                                        weather_code = values.get('weatherCode')
-                                        precipitation_prob = values.get('precipitationProbability')
-                                        
-                                        response_text += f"⏰ {time}:\n"
-                                        if temp is not None:
-                                            temp_str = f"{temp}°C"
-                                            if apparent_temp is not None:
-                                                temp_str += f" (Feels like {apparent_temp}°C)"
-                                            response_text += f"   🌡️ {temp_str}\n"
-                                        if humidity is not None:
-                                            response_text += f"   💧 Humidity: {humidity}%\n"
-                                        if precipitation_prob is not None:
-                                            response_text += f"   🌧️ Precipitation: {precipitation_prob}%\n"
-                                        if wind_speed is not None:
-                                            response_text += f"   💨 Wind: {wind_speed} m/s\n"
-                                        response_text += "\n"
-                                
-                                return response_text
-                                
-                        return "Unable to extract forecast information."
+                        yield "\n".join(_format_forecast_fallback(data, location) for location, data in found)
                     except (KeyError, IndexError, TypeError, ValueError) as e:
-                        return f"Sorry, I couldn't parse the forecast data. Error: {str(e)}"
+                        yield f"Sorry, I couldn't parse the forecast data. Error: {str(e)}"
+                if errors:
+                    yield "\n\n" + "\n\n".join(errors)
+                return complete and not errors
             else:
-                return "Please specify a location to get the weather forecast."
+                self._discard_prefetch(prefetch)
+                yield "Please specify a location to get the weather forecast."
         
         else:  # general action
-            # Use Gemini for general weather questions
-            context = "\n".join([f"User: {msg['content']}" if msg['role'] == 'user' else f"Assistant: {msg['content']}" 
-                                for msg in chat_history[-5:]])  # Last 5 messages for context
+            self._discard_prefetch(prefetch)
+            cacheable = not action_data.get("routing_failed")
+            answer = action_data.get("answer")
+            if answer:
+                _general_answer_cache.set(user_query, answer, namespace=context_key)
+                yield answer
+                return True
             
-            prompt = f"""
-            You are a helpful weather assistant. Answer the user's question based on your knowledge about weather.
-            Keep your responses concise and informative. Use emojis where appropriate to make your responses visually appealing.
+            # Routing failed or Gemini gave no answer text, so compose one with a separate call
+            context = "\n".join(history_lines)
             
-            Conversation history:
-            {context}
-            
-            User's latest question: {user_query}
-            """
+            prompt = GENERAL_TEMPLATE.format(context=context, user_query=user_query)
             
             try:
-                response = self.model.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=prompt
-                )
-                # Access the text content properly
-                if hasattr(response, 'text'):
-                    return response.text
-                else:
-                    # Handle different response format
-                    return str(response)
+                parts = []
+                complete = yield from self._stream_reply(prompt, _GENERAL_CONFIG, parts)
+                if complete and cacheable:
+                    _general_answer_cache.set(user_query, "".join(parts), namespace=context_key)
+                return complete and cacheable
             except Exception as e:
-                return f"Sorry, I'm having trouble processing your request right now. Error: {str(e)}"
\ No newline at end of file
+                yield f"Sorry, I'm having trouble processing your request right now. Error: {str(e)}"
@@ -2,46 +2,83 @@
 Weather Agent - Handles all interactions with the Tomorrow.io Weather API
 """
 
+import logging
 import requests
-from datetime import datetime
-from typing import Dict, Any, Union
-import os
-from dotenv import load_dotenv
-load_dotenv()
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Any, Tuple
+from utils.cache import TTLCache
 
+logger = logging.getLogger(__name__)
 
 # Weather API configuration
 TOMORROW_API_BASE_URL = "https://api.tomorrow.io/v4/weather"
 
+# How long successful responses are reused for repeated lookups (seconds)
+CURRENT_WEATHER_TTL = 10 * 60
+FORECAST_TTL = 30 * 60
+
+# (connect, read) timeouts in seconds. Realtime payloads are small, so fail fast;
+# the forecast body is much larger and gets a longer read allowance.
+CURRENT_WEATHER_TIMEOUT = (3.05, 5)
+FORECAST_TIMEOUT = (3.05, 15)
+
+# Transient upstream failures are retried with exponential backoff (0.3s, 0.6s, 1.2s).
+# The final failed response is returned rather than raised, so it still maps to an error dict.
+# Read timeouts are not retried and connection failures only once, so a stalled request
+# fails within roughly one read timeout instead of several.
+RETRY_POLICY = Retry(
+    total=3,
+    connect=1,
+    read=False,
+    backoff_factor=0.3,
+    status_forcelist=(500, 502, 503, 504),
+    allowed_methods=frozenset(["GET"]),
+    raise_on_status=False
+)
+
 
 class WeatherAgent:
     """Agent responsible for handling weather data requests using Tomorrow.io API."""
     
     def __init__(self, api_key: str):
-        self.api_key = api_key
+        # Reuse keep-alive connections to Tomorrow.io across requests. The pool is sized
+        # for the chat agent's worker threads issuing requests concurrently.
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=RETRY_POLICY))
+        # Send the key once per session as a header so request URLs depend only on the location
+        self._session.headers.update({"apikey": api_key})
+        self._current_cache = TTLCache(maxsize=256, ttl=CURRENT_WEATHER_TTL)
+        self._forecast_cache = TTLCache(maxsize=256, ttl=FORECAST_TTL)
     
-    def get_current_weather(self, location: str) -> Dict[str, Any]:
-        """Get current weather for a location using Tomorrow.io API."""
-        if not location:
-            return {"error": "Location is required"}
-            
-        url = f"{TOMORROW_API_BASE_URL}/realtime"
-        params = {
-            "location": location,
-            "apikey": self.api_key
-        }
+    def close(self) -> None:
+        """Close the pooled HTTP connections."""
+        self._session.close()
+    
+    def _request(self, endpoint: str, location: str, cache: TTLCache,
+                 timeout: Tuple[float, float]) -> Dict[str, Any]:
+        """GET a Tomorrow.io endpoint for a location, returning the JSON body or an error dict.
+        
+        Successful responses are cached per location; errors are never cached.
+        """
+        cache_key = location.strip().lower()
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        # Debug: Print request details
-        print(f"Making request to: {url}")
-        print(f"Params: {params}")
+        url = f"{TOMORROW_API_BASE_URL}/{endpoint}"
+        params = {"location": location}
+        logger.debug("Making request to: %s (location=%s)", url, location)
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            print(f"Response status code: {response.status_code}")
+            response = self._session.get(url, params=params, timeout=timeout)
+            logger.debug("Response status code: %s", response.status_code)
             if response.status_code != 200:
-                print(f"Response content: {response.text}")
+                logger.debug("Response content: %s", response.text)
             response.raise_for_status()
-            return response.json()
+            data = response.json()
+            cache.set(cache_key, data)
+            return data
         except requests.exceptions.Timeout:
             return {"error": "Weather API request timed out"}
         except requests.exceptions.ConnectionError as e:
@@ -58,7 +95,8 @@ class WeatherAgent:
                         error_response = e.response.json()
                         if 'message' in error_response:
                             error_detail = error_response['message']
-                    except:
+                    except ValueError:
+                        # The body was not JSON
                         pass
                     return {"error": error_detail}
                 elif e.response.status_code == 400:
@@ -70,55 +108,17 @@ class WeatherAgent:
         except requests.exceptions.RequestException as e:
             return {"error": f"Weather API error: {str(e)}"}
     
-    def get_forecast(self, location: str, days: int = 5) -> Dict[str, Any]:
-        """Get weather forecast for a location using Tomorrow.io API."""
+    def get_current_weather(self, location: str) -> Dict[str, Any]:
+        """Get current weather for a location using Tomorrow.io API."""
         if not location:
             return {"error": "Location is required"}
-            
-        # Limit days to reasonable range
-        days = max(1, min(days, 10))  # Tomorrow.io supports up to 10 days
-        
-        url = f"{TOMORROW_API_BASE_URL}/forecast"
-        params = {
-            "location": location,
-            "apikey": self.api_key
-        }
-        
-        # Debug: Print request details
-        print(f"Making forecast request to: {url}")
-        print(f"Params: {params}")
+        return self._request("realtime", location, self._current_cache, CURRENT_WEATHER_TIMEOUT)
+    
+    def get_forecast(self, location: str) -> Dict[str, Any]:
+        """Get weather forecast for a location using Tomorrow.io API.
         
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            print(f"Forecast response status code: {response.status_code}")
-            if response.status_code != 200:
-                print(f"Forecast response content: {response.text}")
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.Timeout:
-            return {"error": "Weather API request timed out"}
-        except requests.exceptions.ConnectionError as e:
-            return {"error": f"Connection error. Please check your internet connection. Details: {str(e)}"}
-        except requests.exceptions.HTTPError as e:
-            if hasattr(e.response, 'status_code'):
-                if e.response.status_code == 404:
-                    return {"error": f"Location '{location}' not found. Please check the spelling."}
-                elif e.response.status_code == 401:
-                    # Let's provide more detailed error information
-                    error_detail = "Invalid or missing API key for Tomorrow.io weather service"
-                    try:
-                        # Try to get more details from the response
-                        error_response = e.response.json()
-                        if 'message' in error_response:
-                            error_detail = error_response['message']
-                    except:
-                        pass
-                    return {"error": error_detail}
-                elif e.response.status_code == 400:
-                    return {"error": "Bad request. Please check the location format."}
-                else:
-                    return {"error": f"Weather API error: {e.response.status_code} - {e.response.reason}"}
-            else:
-                return {"error": f"Weather API HTTP error: {str(e)}"}
-        except requests.exceptions.RequestException as e:
-            return {"error": f"Weather API error: {str(e)}"}
\ No newline at end of file
+        The full timelines are returned; callers trim them to the days they need.
+        """
+        if not location:
+            return {"error": "Location is required"}
+        return self._request("forecast", location, self._forecast_cache, FORECAST_TIMEOUT)
@@ -6,26 +6,148 @@ Google Gemini AI, and Tomorrow.io Weather API.
 """
 
 import streamlit as st
+import hashlib
 import os
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Final
 from dotenv import load_dotenv
 from google import genai
-from agents.chat_agent import ChatAgent
+from agents.chat_agent import ChatAgent, names_place
+from utils.cache import SemanticCache, TTLCache
+from utils.background import fire_and_forget, wait_for_pending
+from utils.history import ChatHistoryStore
 
-# Load environment variables
-load_dotenv()
+# Only the most recent messages are kept in session state and re-rendered on each
+# rerun; the full transcript lives in SQLite and older messages load on request
+LIVE_MESSAGES = 20
+# Turns (user + assistant message pairs) of context handed to the chat agent
+HISTORY_TAIL = 8
+
+# Minimum seconds between placeholder redraws while a reply streams in
+STREAM_REFRESH_INTERVAL = 0.08
+
+# Identical questions asked after the same recent messages, in any session, reuse the
+# previous answer for a few minutes
+EXACT_CACHE_HISTORY = 6
+EXACT_CACHE_TTL = 5 * 60
+
+# Near-duplicate questions within a session reuse the previous answer for a while
+RESPONSE_CACHE_THRESHOLD = 0.92
+RESPONSE_CACHE_TTL = 10 * 60
+
+# The session cache only serves questions that name their place (see names_place) and
+# do not refer back to earlier turns or to a relative time, since only their answers
+# stay the same as the conversation moves on
+_CONTEXT_DEPENDENT_RE = re.compile(
+    r"\b(?:now|today|currently|tonight|tomorrow|yesterday|there|here|that|these|those|same|instead)\b",
+    re.IGNORECASE
+)
+
+# Static page content, built once at import rather than on every rerun
+_DARK_THEME_CSS: Final[str] = """
+<style>
+.stApp {
+    background-color: #0e1117;
+    color: #fafafa;
+}
+.stTextInput > label {
+    color: #fafafa;
+}
+.stTextInput > div > input {
+    background-color: #262730;
+    color: #fafafa;
+    border: 1px solid #4a4a4a;
+}
+.stButton > button {
+    background-color: #1f77b4;
+    color: white;
+}
+.chat-message {
+    padding: 1.5rem;
+    border-radius: 0.5rem;
+    margin-bottom: 1rem;
+}
+.user-message {
+    background-color: #262730;
+    border-left: 5px solid #1f77b4;
+    color: #fafafa;
+}
+.assistant-message {
+    background-color: #262730;
+    border-left: 5px solid #2ca02c;
+    color: #fafafa;
+}
+h1, h2, h3, h4, h5, h6 {
+    color: #fafafa;
+}
+.sidebar .sidebar-content {
+    background-color: #0e1117;
+    color: #fafafa;
+}
+.sidebar .sidebar-content a {
+    color: #1f77b4;
+}
+</style>
+"""
+
+_SIDEBAR_ABOUT_MD: Final[str] = """
+This is an agentic weather chatbot that uses:
+- **Google Gemini AI** for natural language understanding
+- **Tomorrow.io Weather API** for real weather data
+
+### Features:
+- Current weather information
+- Weather forecasts
+- General weather knowledge
+"""
+
+_SIDEBAR_EXAMPLES_MD: Final[str] = """
+- "What's the weather like in London?"
+- "Give me a 5-day forecast for New York"
+- "How does rain form?"
+- "Will it rain tomorrow in Tokyo?"
+"""
+
+
+@dataclass(frozen=True)
+class Config:
+    """Settings read from the environment (and the .env file)."""
+    gemini_api_key: str
+    tomorrow_api_key: str
+    history_db_path: str
+
+
+@st.cache_resource
+def load_config() -> Config:
+    """Load environment variables once per process and return the app settings."""
+    load_dotenv()
+    return Config(
+        gemini_api_key=os.getenv("GEMINI_API_KEY", ""),
+        tomorrow_api_key=os.getenv("TOMORROW_API_KEY", ""),
+        history_db_path=os.getenv("CHAT_HISTORY_DB", "chat_history.db")
+    )
+
+
+@st.cache_resource
+def get_genai_client() -> genai.Client:
+    """Return the Gemini client, created once per process rather than per rerun.
+    
+    The key comes from load_config(), so changing it requires restarting the app.
+    """
+    return genai.Client(api_key=load_config().gemini_api_key)
 
-# Configure APIs
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-TOMORROW_API_KEY = os.getenv("TOMORROW_API_KEY")
-print("GEMINI_API_KEY loaded:", bool(GEMINI_API_KEY))
-print("TOMORROW_API_KEY loaded:", bool(TOMORROW_API_KEY))
-if TOMORROW_API_KEY:
-    print("TOMORROW_API_KEY length:", len(TOMORROW_API_KEY))
 
 def initialize_app():
-    """Initialize the application and check dependencies."""
+    """Initialize the application and check dependencies.
+    
+    Not cached itself, so missing keys show the setup help on every rerun.
+    """
+    config = load_config()
     # Check if API keys are available
-    if not GEMINI_API_KEY or not TOMORROW_API_KEY:
+    if not config.gemini_api_key or not config.tomorrow_api_key:
         st.error("Please set both GEMINI_API_KEY and TOMORROW_API_KEY in your .env file")
         st.info("You can get your API keys from:")
         st.markdown("- [Google AI Studio](https://ai.google.dev/) for Gemini API")
@@ -33,101 +155,102 @@ def initialize_app():
         st.stop()
 
     try:
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        return client
+        return get_genai_client()
     except Exception as e:
         st.error(f"Error initializing Gemini client: {str(e)}")
         st.stop()
 
 
+@st.cache_resource
+def get_chat_agent(_client):
+    """Return the process-wide ChatAgent shared by all sessions (it keeps no per-session state)."""
+    return ChatAgent(_client)
+
+
+@st.cache_resource
+def get_history_store():
+    """Return the process-wide chat transcript store."""
+    return ChatHistoryStore(load_config().history_db_path)
+
+
+@st.cache_resource
+def get_exact_response_cache() -> TTLCache:
+    """Return the process-wide cache of replies keyed by _response_key()."""
+    return TTLCache(maxsize=512, ttl=EXACT_CACHE_TTL)
+
+
+def _response_key(prompt, messages):
+    """Return a stable digest of the prompt and the last few messages it follows."""
+    recent = tuple((m["role"], m["content"]) for m in messages[-EXACT_CACHE_HISTORY:])
+    return hashlib.blake2b(repr((prompt, recent)).encode(), digest_size=16).hexdigest()
+
+
+@st.cache_data(max_entries=32)
+def _older_messages_md(session_id, archived_count):
+    """Return the first archived_count messages of a session as a single markdown block.
+    
+    The block is rebuilt once per newly archived turn instead of re-queried and
+    re-rendered message by message on every rerun.
+    """
+    # Transcript writes are queued in the background; make sure they have landed
+    wait_for_pending()
+    messages = get_history_store().first_messages(session_id, archived_count)
+    return "\n\n---\n\n".join(
+        f"**{'You' if m['role'] == 'user' else 'Assistant'}:** {m['content']}" for m in messages
+    )
+
+
+def _render_sidebar():
+    """Render the static About and Example Questions sidebar."""
+    with st.sidebar:
+        st.header("About")
+        st.markdown(_SIDEBAR_ABOUT_MD)
+        
+        st.header("Example Questions")
+        st.markdown(_SIDEBAR_EXAMPLES_MD)
+
+
 def main():
     """Main application function."""
+    # Streamlit UI (page config must come before any other element, including setup errors)
+    st.set_page_config(page_title="Weather Agent Chatbot", page_icon="🌤️", layout="wide")
+    
     # Initialize the app
     client = initialize_app()
     
     # Initialize the chat agent
-    chat_agent = ChatAgent(client)
-
-    # Streamlit UI
-    st.set_page_config(page_title="Weather Agent Chatbot", page_icon="🌤️", layout="wide")
+    chat_agent = get_chat_agent(client)
     
     # Custom CSS for better UI with dark theme
-    st.markdown("""
-        <style>
-        .stApp {
-            background-color: #0e1117;
-            color: #fafafa;
-        }
-        .stTextInput > label {
-            color: #fafafa;
-        }
-        .stTextInput > div > input {
-            background-color: #262730;
-            color: #fafafa;
-            border: 1px solid #4a4a4a;
-        }
-        .stButton > button {
-            background-color: #1f77b4;
-            color: white;
-        }
-        .chat-message {
-            padding: 1.5rem;
-            border-radius: 0.5rem;
-            margin-bottom: 1rem;
-        }
-        .user-message {
-            background-color: #262730;
-            border-left: 5px solid #1f77b4;
-            color: #fafafa;
-        }
-        .assistant-message {
-            background-color: #262730;
-            border-left: 5px solid #2ca02c;
-            color: #fafafa;
-        }
-        h1, h2, h3, h4, h5, h6 {
-            color: #fafafa;
-        }
-        .sidebar .sidebar-content {
-            background-color: #0e1117;
-            color: #fafafa;
-        }
-        .sidebar .sidebar-content a {
-            color: #1f77b4;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(_DARK_THEME_CSS, unsafe_allow_html=True)
     
     st.title("🌤️ Weather Agent Chatbot")
     st.markdown("Ask me anything about weather! I can provide current weather, forecasts, and general weather information.")
     
     # Sidebar with information
-    with st.sidebar:
-        st.header("About")
-        st.markdown("""
-        This is an agentic weather chatbot that uses:
-        - **Google Gemini AI** for natural language understanding
-        - **Tomorrow.io Weather API** for real weather data
-        
-        ### Features:
-        - Current weather information
-        - Weather forecasts
-        - General weather knowledge
-        """)
-        
-        st.header("Example Questions")
-        st.markdown("""
-        - "What's the weather like in London?"
-        - "Give me a 5-day forecast for New York"
-        - "How does rain form?"
-        - "Will it rain tomorrow in Tokyo?"
-        """)
+    _render_sidebar()
+    
+    history_store = get_history_store()
+    exact_cache = get_exact_response_cache()
     
     # Initialize session state
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "archived_count" not in st.session_state:
+        # Messages dropped from the live tail, which are only in the transcript store
+        st.session_state.archived_count = 0
+    if "response_cache" not in st.session_state:
+        st.session_state.response_cache = SemanticCache(
+            threshold=RESPONSE_CACHE_THRESHOLD, maxsize=100, ttl=RESPONSE_CACHE_TTL
+        )
 
-    # Display chat history
+    # Display chat history, fetching messages older than the live tail only when asked
+    session_id = st.session_state.session_id
+    if st.session_state.archived_count:
+        if st.toggle("Show older messages"):
+            st.markdown(_older_messages_md(session_id, st.session_state.archived_count))
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
@@ -136,6 +259,7 @@ def main():
     if prompt := st.chat_input("Ask about weather..."):
         # Add user message to chat history
         st.session_state.messages.append({"role": "user", "content": prompt})
+        fire_and_forget(history_store.append, session_id, "user", prompt)
         with st.chat_message("user"):
             st.markdown(prompt)
         
@@ -144,22 +268,44 @@ def main():
             message_placeholder = st.empty()
             message_placeholder.markdown("Thinking...")
             
-            # Get bot response
-            response = chat_agent.get_response(prompt, st.session_state.messages)
-            
-            # Render response - now it's always text/markdown from the LLM
-            if isinstance(response, dict):
-                # This shouldn't happen anymore, but just in case
-                message_placeholder.markdown(str(response))
+            response_key = _response_key(prompt, st.session_state.messages)
+            cacheable = names_place(prompt) and not _CONTEXT_DEPENDENT_RE.search(prompt)
+            response = exact_cache.get(response_key)
+            if response is None and cacheable:
+                response = st.session_state.response_cache.get(prompt)
+            if response is not None:
+                message_placeholder.markdown(response)
             else:
-                # Display the LLM-generated markdown/text response
+                # Render the LLM-generated markdown as it streams in, redrawing at most
+                # every STREAM_REFRESH_INTERVAL seconds
+                chunks = []
+                last_refresh = 0.0
+                recent = st.session_state.messages[-HISTORY_TAIL * 2:]
+                stream = chat_agent.get_response_stream(prompt, recent)
+                for chunk in stream:
+                    chunks.append(chunk)
+                    now = time.monotonic()
+                    if now - last_refresh >= STREAM_REFRESH_INTERVAL:
+                        message_placeholder.markdown("".join(chunks))
+                        last_refresh = now
+                response = "".join(chunks)
                 message_placeholder.markdown(response)
+                # Only cache regular answers; errors and fallbacks are usually transient
+                if stream.complete:
+                    exact_cache.set(response_key, response)
+                    if cacheable:
+                        st.session_state.response_cache.set(prompt, response)
         
         # Add bot response to chat history
         st.session_state.messages.append({
             "role": "assistant",
-            "content": str(response)
+            "content": response
         })
+        fire_and_forget(history_store.append, session_id, "assistant", response)
+        overflow = len(st.session_state.messages) - LIVE_MESSAGES
+        if overflow > 0:
+            del st.session_state.messages[:overflow]
+            st.session_state.archived_count += overflow
 
 
 if __name__ == "__main__":
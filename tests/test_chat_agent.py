@@ -0,0 +1,85 @@
+"""
+Tests for the local query classification and fallback formatting in agents.chat_agent
+"""
+
+import pytest
+from agents.chat_agent import _fast_classify, _format_forecast_fallback, _split_places, names_place
+
+
+@pytest.mark.parametrize("query, city", [
+    ("What is the weather in St. Louis?", "St. Louis"),
+    ("weather in Washington, D.C.", "Washington, D.C."),
+    ("Temperature at Noon in Rome", "Rome"),
+    ("What's the weather like in London today?", "London"),
+    ("weather in Springfield, IL", "Springfield, IL"),
+])
+def test_fast_classify_current_weather(query, city):
+    assert _fast_classify(query) == {"action": "current_weather", "parameters": {"city": city}}
+
+
+def test_fast_classify_forecast():
+    assert _fast_classify("Weather forecast for Paris for the next 3 days please") == {
+        "action": "forecast", "parameters": {"city": "Paris", "days": 3}
+    }
+
+
+def test_fast_classify_multi_city_forecast():
+    assert _fast_classify("Weather in Paris and London for 3 days") == {
+        "action": "forecast", "parameters": {"city": "Paris", "cities": ["Paris", "London"], "days": 3}
+    }
+
+
+@pytest.mark.parametrize("text, places", [
+    ("Paris, France and Berlin, Germany", ["Paris, France", "Berlin, Germany"]),
+    ("Portland, OR and Austin, TX", ["Portland, OR", "Austin, TX"]),
+    ("London, Paris and Tokyo", ["London", "Paris", "Tokyo"]),
+    ("London, Paris, Tokyo", ["London", "Paris", "Tokyo"]),
+    ("Paris, France", ["Paris, France"]),
+    ("Washington, D.C.", ["Washington, D.C."]),
+])
+def test_split_places(text, places):
+    assert _split_places(text) == places
+
+
+@pytest.mark.parametrize("query", [
+    "What is the average temperature in Paris in December?",
+    "What causes rain in India during the Monsoon?",
+    "How is the weather in Paris during Fashion Week?",
+    "weather in Paris. What about tomorrow?",
+    "weather in London, Paris",
+    "How does rain form?",
+])
+def test_fast_classify_leaves_other_queries_to_gemini(query):
+    assert _fast_classify(query) is None
+
+
+def test_format_forecast_fallback_uses_finest_timeline():
+    forecast_data = {
+        "location": {"name": "Paris, France"},
+        "timelines": {
+            "hourly": [{"time": "2024-01-01T00:00:00Z",
+                        "values": {"temperature": 4, "temperatureApparent": 1, "windSpeed": 3}}],
+            "daily": [{"time": "2024-01-01T00:00:00Z", "values": {"temperatureMax": 7}}],
+        },
+    }
+    assert _format_forecast_fallback(forecast_data, "Paris") == (
+        "🌤️ Weather forecast for Paris, France:\n\n"
+        "⏰ 2024-01-01T00:00:00Z:\n"
+        "   🌡️ 4°C (Feels like 1°C)\n"
+        "   💨 Wind: 3 m/s\n"
+        "\n"
+    )
+
+
+def test_format_forecast_fallback_without_entries():
+    assert _format_forecast_fallback({"timelines": {}}, "Paris") == "Unable to extract forecast information."
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("what's the weather in London?", True),
+    ("Is it raining in St. Louis", True),
+    ("What should I wear?", False),
+    ("And in January?", False),
+])
+def test_names_place(query, expected):
+    assert names_place(query) is expected
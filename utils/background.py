@@ -0,0 +1,29 @@
+"""
+Deferred execution of side effects (persistence, telemetry) off the render path
+"""
+
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# A single worker runs tasks in submission order, so e.g. transcript writes
+# land in the order the messages were sent
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="background")
+
+
+def _log_failure(future: Future) -> None:
+    """Log the exception of a failed background task, which would otherwise be lost."""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Background task failed", exc_info=future.exception())
+
+
+def fire_and_forget(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+    """Run fn(*args, **kwargs) in the background without waiting for its result."""
+    _executor.submit(fn, *args, **kwargs).add_done_callback(_log_failure)
+
+
+def wait_for_pending() -> None:
+    """Block until every task submitted so far has run."""
+    _executor.submit(lambda: None).result()
@@ -0,0 +1,131 @@
+"""
+Small in-process caches shared by the agents and the Streamlit app
+"""
+
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Hashable, Optional
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Words that carry no meaning for matching questions against each other
+_STOP_WORDS = frozenset((
+    "a", "about", "an", "and", "are", "can", "could", "describe", "do", "does",
+    "explain", "for", "how", "i", "is", "it", "me", "of", "on", "please", "s",
+    "tell", "the", "to", "what", "whats", "why", "would", "you",
+))
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed time-to-live (in seconds)."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Return the cached value for key, or default if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            stored_at, value = entry
+            if time.monotonic() - stored_at >= self.ttl:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store value under key, evicting the least recently used entries if full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all cached entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _term_vector(text: str) -> Counter:
+    """Return the word and word-bigram counts of text, ignoring case, punctuation and stop words.
+
+    The bigrams make the similarity order-aware, so "30 C to F" and "30 F to C" differ.
+    """
+    words = [w for w in _WORD_RE.findall(text.lower().replace("'", "")) if w not in _STOP_WORDS]
+    vector = Counter(words)
+    vector.update(zip(words, words[1:]))
+    return vector
+
+
+class SemanticCache:
+    """Thread-safe cache that also answers lookups for text similar to a stored key.
+
+    Similarity is the cosine of word and bigram term vectors, so rephrasings such as
+    "what's humidity?" and "explain humidity" resolve to the same entry. Entries are
+    only matched within the same namespace, e.g. a digest of the conversation context
+    the value was produced in.
+    """
+
+    def __init__(self, threshold: float = 0.85, maxsize: int = 1000, ttl: Optional[float] = None):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str, default: Optional[Any] = None, namespace: Hashable = None) -> Any:
+        """Return the value stored under the most similar key in namespace above threshold, or default."""
+        vector = _term_vector(text)
+        if not vector:
+            return default
+        norm = math.sqrt(sum(c * c for c in vector.values()))
+        now = time.monotonic()
+        best_key, best_score = None, self.threshold
+        with self._lock:
+            for key, (stored_vector, stored_norm, stored_at, _) in list(self._entries.items()):
+                if self.ttl is not None and now - stored_at >= self.ttl:
+                    del self._entries[key]
+                    continue
+                if key[0] != namespace:
+                    continue
+                dot = sum(c * stored_vector[w] for w, c in vector.items())
+                score = dot / (norm * stored_norm)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                return default
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][3]
+
+    def set(self, text: str, value: Any, namespace: Hashable = None) -> None:
+        """Store value under text in namespace, evicting the least recently used entries if full."""
+        vector = _term_vector(text)
+        if not vector:
+            return
+        norm = math.sqrt(sum(c * c for c in vector.values()))
+        key = (namespace, frozenset(vector.items()))
+        with self._lock:
+            self._entries[key] = (vector, norm, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all cached entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
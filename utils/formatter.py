@@ -6,60 +6,83 @@ send the raw API data to the LLM for natural language composition. However, they
 are kept for backward compatibility and potential future use.
 """
 
-import pandas as pd
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, Any, List
 
+_UNIT_SYM = {"metric": "°C", "imperial": "°F"}
+
+_CURRENT_WEATHER_MD = """
+**📍 {city}**  
+**🌡 Temperature:** `{temp}`  
+**☁ Condition:** {cond}  
+**💧 Humidity:** {humidity}  
+**💨 Wind:** {wind}  
+> _Updated:_ {updated}
+"""
+
+# Show only a few times per day to avoid huge lists
+_TIMES_TO_SHOW = frozenset(("00:00", "08:00", "14:00", "20:00"))
+
+# Missing temperatures render as "nan", as they did when grouping with pandas
+_NAN = float("nan")
+
+
+@lru_cache(maxsize=256)
+def _title(text: str) -> str:
+    """Title-case a condition description; the vocabulary is small and repeats a lot."""
+    return text.title()
+
 
 def format_current_weather_md(data: Dict[str, Any]) -> str:
     """Return markdown string for current weather (with emojis)."""
-    unit_sym = "°C" if data.get("units") == "metric" else "°F" if data.get("units")=="imperial" else "K"
-    updated_ts = data.get("updated")
-    updated_str = datetime.fromtimestamp(updated_ts).strftime("%Y-%m-%d %H:%M") if updated_ts else "N/A"
+    # resolve every missing value to its display default once, up front
+    city = data.get("city") or "Unknown"
     temp = data.get("temp")
-    cond = (data.get("condition") or "Unknown").title()
     humidity = data.get("humidity")
     wind = data.get("wind_speed")
+    updated_ts = data.get("updated")
+    return _CURRENT_WEATHER_MD.format(
+        city=city,
+        temp="N/A" if temp is None else f"{temp:.1f}{_UNIT_SYM.get(data.get('units'), 'K')}",
+        cond=_title(data.get("condition") or "Unknown"),
+        humidity="N/A" if humidity is None else f"{humidity}%",
+        wind="N/A" if wind is None else f"{wind} m/s",
+        updated=datetime.fromtimestamp(updated_ts).isoformat(" ", "minutes") if updated_ts else "N/A",
+    )
 
-    md = f"""
-**📍 {data.get('city')}**  
-**🌡 Temperature:** `{temp:.1f}{unit_sym}`  
-**☁ Condition:** {cond}  
-**💧 Humidity:** {humidity}%  
-**💨 Wind:** {wind} m/s  
-> _Updated:_ {updated_str}
-"""
-    return md
+
+def _append_day(parts: List[str], date: str, rows: List[tuple], unit_sym: str) -> None:
+    """Append one day's header and selected (time, temp, description) rows to parts."""
+    temps = [temp for _, temp, _ in rows if temp is not None]
+    low = min(temps, default=_NAN)
+    high = max(temps, default=_NAN)
+    parts.append(f"**📅 {date}** — Min: {low:.1f}{unit_sym}, Max: {high:.1f}{unit_sym}\n\n")
+    # pick the preferred times present, else the first few
+    shown = [row for row in rows if row[0] in _TIMES_TO_SHOW] or rows[:4]
+    for time, temp, desc in shown:
+        parts.append(f"- {time}: {_NAN if temp is None else temp:.1f}{unit_sym}, {desc}\n")
+    parts.append("\n")
 
 
 def format_forecast_markdown(city: str, units: str, forecast_list: List[Dict], days: int = 3) -> str:
     """Group forecast_list by day and return markdown. forecast_list expected to be OWM 'list' items."""
-    unit_sym = "°C" if units == "metric" else "°F" if units=="imperial" else "K"
-    # convert to DataFrame for easy grouping
-    rows = []
-    for item in forecast_list:
-        ts = int(item.get("dt", 0))
-        dt = datetime.fromtimestamp(ts)
-        date = dt.strftime("%Y-%m-%d")
-        time = dt.strftime("%H:%M")
-        temp = item.get("main", {}).get("temp")
-        desc = item.get("weather", [{}])[0].get("description", "").title()
-        rows.append({"date": date, "time": time, "temp": temp, "desc": desc})
-
-    df = pd.DataFrame(rows)
-    if df.empty:
+    unit_sym = _UNIT_SYM.get(units, "K")
+    if not forecast_list:
         return "No forecast available."
 
-    md = f"**🌤 {days}-day forecast for {city}**\n\n"
-    for date, g in df.groupby("date"):
-        md += f"**📅 {date}** — Min: {g['temp'].min():.1f}{unit_sym}, Max: {g['temp'].max():.1f}{unit_sym}\n\n"
-        # show only a few times per day (e.g., 00:00, 08:00, 14:00, 20:00) to avoid huge lists
-        times_to_show = ["00:00", "08:00", "14:00", "20:00"]
-        # pick nearest times present
-        shown = g[g['time'].isin(times_to_show)]
-        if shown.empty:
-            shown = g.head(4)
-        for _, row in shown.iterrows():
-            md += f"- {row['time']}: {row['temp']:.1f}{unit_sym}, {row['desc']}\n"
-        md += "\n"
-    return md
\ No newline at end of file
+    # walk the items in time order once, emitting each day when the date changes
+    parts = [f"**🌤 {days}-day forecast for {city}**\n\n"]
+    current_date, rows = None, []
+    for item in sorted(forecast_list, key=lambda it: int(it.get("dt", 0))):
+        # one "YYYY-MM-DD HH:MM" rendering per item, sliced into date and time
+        stamp = datetime.fromtimestamp(int(item.get("dt", 0))).isoformat(" ", "minutes")
+        if stamp[:10] != current_date:
+            if rows:
+                _append_day(parts, current_date, rows, unit_sym)
+            current_date, rows = stamp[:10], []
+        temp = (item.get("main") or {}).get("temp")
+        desc = _title((item.get("weather") or [{}])[0].get("description") or "")
+        rows.append((stamp[11:], temp, desc))
+    _append_day(parts, current_date, rows, unit_sym)
+    return "".join(parts)
@@ -0,0 +1,45 @@
+"""
+SQLite-backed chat transcript storage, so sessions keep only recent messages in memory
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+
+class ChatHistoryStore:
+    """Thread-safe append-only store of chat messages, one transcript per session id."""
+
+    def __init__(self, path: str = "chat_history.db"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "session TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, ts REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session, id)")
+
+    def append(self, session_id: str, role: str, content: str) -> None:
+        """Add a message to the end of a session's transcript."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO messages (session, role, content, ts) VALUES (?, ?, ?, ?)",
+                (session_id, role, content, time.time())
+            )
+
+    def first_messages(self, session_id: str, limit: int) -> List[Dict[str, str]]:
+        """Return the first limit messages of a session's transcript, in order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE session = ? ORDER BY id LIMIT ?",
+                (session_id, limit)
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()